@@ -24,13 +24,23 @@ SOFTWARE.
 
 import foursquare
 import traceback
+import os
+import re
 import censusdata
 import pickle
+import tempfile
+import hashlib
+import uuid
+import threading
+import collections
+import http.server
 import json
 import pandas as pd 
 import scipy.stats
 import requests
+import urllib.parse
 import folium
+import folium.plugins
 import numpy as np
 from pathlib import Path
 from geopy import Nominatim
@@ -57,6 +67,14 @@ class VipData:
         "fsid": "Valid Foursquare Client Id",
         "fssecret"  : "Valid Foursquare Client Secret",
         "censuskey" : "Valid US Census API Key"
+
+    gazetteer: str;  
+    An index directory created by 'setGazetteerIndex()' used as an
+    offline geocoding fallback. 'None' by default.
+
+    geocode: bool;  
+    Geocodes 'ADDRESS' on initialization. Set 'False' to defer to 
+    'setLocation()'. 'True' by default.
     
     How To Use
     ----------
@@ -72,7 +90,41 @@ class VipData:
         9) dt.start()                   # PERFORMS ABOVE METHODS SEQUENTIALLY
     """
 
-    def __init__(self, address, credentials):
+    ## LOADED GAZETTEER INDEXES, SHARED ACROSS INSTANCES BY DIRECTORY
+    GAZETTEER_CACHE = {}
+    ## FOURSQUARE API CLIENTS, SHARED ACROSS INSTANCES BY CREDENTIALS
+    CLIENT_CACHE = {}
+    ## FILL VALUES FOR MISSING MENU FIELDS OUTSIDE OF COMPACT MODE
+    MENU_PLACEHOLDERS = {
+        'menu': "No menu title", 
+        'section': "No section title",
+        'name': "No item name", 
+        'desc': "No item description"
+        }
+    ## ORDERED STAGES FOR 'runPipeline()' WITH THE STATE EACH CHECKPOINTS
+    PIPELINE_STAGES = [
+        {"name": "LOCATION", "method": "setLocation", "menus": False, 
+            "required": True, "state": ["JSON_DATA.LOCATION", "REPORTS.TRACT"]},
+        {"name": "VENUES", "method": "getVenues", "menus": False, 
+            "required": True, "state": ["JSON_DATA.VENUES", "VENUE_STORE", "REPORTS.TRACT"]},
+        {"name": "VENUES_DF", "method": "setVenuesDf", "menus": False, 
+            "required": True, "state": ["REPORTS.VENUES"]},
+        ## folium maps are not pickled, see 'getVenuesMap()'
+        {"name": "MAP", "method": "setVenuesMap", "menus": False, 
+            "required": False, "state": []},
+        {"name": "MENUS", "method": "getMenus", "menus": True, 
+            "required": True, "state": ["JSON_DATA.MENUS"]},
+        {"name": "MENUS_DF", "method": "setMenusDf", "menus": True, 
+            "required": True, "state": ["REPORTS.MENUS", "MENU_INDEX"]},
+        {"name": "STATS", "method": "getMenuStats", "menus": True, 
+            "required": True, "state": ["REPORTS.STATS"]},
+        {"name": "PICKLE", "method": "setPickle", "menus": True, 
+            "required": False, "state": []},
+        {"name": "JSON", "method": "setJson", "menus": True, 
+            "required": False, "state": []}
+        ]
+
+    def __init__(self, address, credentials, gazetteer=None, geocode=True):
         """
         Description
         -----------
@@ -81,23 +133,32 @@ class VipData:
         self.__version__ = '1.0.1'
         self.ADDRESS = str(address)  # STRING
         self.CREDENTIALS = credentials  # DICTIONARY
+        self.GAZETTEER = gazetteer  # STRING
         self.JSON_DATA = {
             'LOCATION': None,
             'VENUES': None, 
             'MENUS': None
             }
+        self.VENUE_STORE = {}  # DICTIONARY KEYED BY VENUE ID
+        self.MENU_INDEX = None  # DICTIONARY
         self.REPORTS = {
             'TRACT': {}, 
             'VENUES':None, 
             'MENUS':None, 
             'STATS':None, 
-            'MAP':None
+            'MAP':None,
+            'MEMORY': {},
+            'GRID':None,
+            'HEATMAP':None
             }
         self.OUTPUT_LABELS = {
             'pickleLabel' : ("{}.pickle").format(self.ADDRESS),
             'jsonLabel' : ("{}.json").format(self.ADDRESS),
             'xlLabel' : ("{}.xlsx").format(self.ADDRESS),
-            'foliumLabel' : ("{}.html").format(self.ADDRESS)
+            'foliumLabel' : ("{}.html").format(self.ADDRESS),
+            'gridLabel' : ("{}.grid.npz").format(self.ADDRESS),
+            'heatmapLabel' : ("{}.heatmap.html").format(self.ADDRESS),
+            'checkpointLabel' : ("{}.checkpoints").format(self.ADDRESS)
             }
         self.VENUE_CATEGORIES = {
             "COLOR_CODES": [
@@ -139,17 +200,72 @@ class VipData:
                     ]
                 }
             }
+        if geocode == True:
+            VipData.setLocation(self)
+        print("Version:", self.__version__,"object initialized!")
+
+    def setOutputLabels(self, directory, stem=None):
+        """
+        Description
+        -----------
+        Moves every 'OUTPUT_LABELS' file name into a directory, named from a
+        file-safe stem instead of the raw 'ADDRESS'.
+
+        Parameters
+        ----------
+        directory: str;  
+        A directory for output files.
+
+        stem: str;  
+        A file name stem. Defaults to a slug of 'ADDRESS' with a short hash.
+        """
+        if stem is None:
+            slug = re.sub(r"[^A-Za-z0-9]+", "_", self.ADDRESS).strip("_")[:80]
+            digest = hashlib.sha1(self.ADDRESS.encode("utf-8")).hexdigest()[:8]
+            stem = ("{}_{}").format(slug, digest)
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        for key, label in self.OUTPUT_LABELS.items():
+            ## labels are the address followed by a fixed suffix
+            suffix = label[len(self.ADDRESS):]
+            self.OUTPUT_LABELS[key] = str(Path(directory) / (stem + suffix))
+        return self.OUTPUT_LABELS
+
+    def __getstate__(self):
+        """Returns instance state for pickling without folium maps or API keys."""
+        state = dict(self.__dict__)
+        state['REPORTS'] = dict(self.REPORTS, MAP=None, HEATMAP=None)
+        state['CREDENTIALS'] = None
+        return state
+
+    def setLocation(self):
+        """
+        Description
+        -----------
+        Geocodes 'ADDRESS' and sets its census tract values, falling back from
+        the Census geocoder to a gazetteer index and then to Nominatim.
+        """
         try:
             self.JSON_DATA['LOCATION'] = VipData.getCensusGeo(self)
+            ## an empty match list is treated as a failed geocode
+            self.JSON_DATA['LOCATION']['json']['result']['addressMatches'][0]
         except:
-            print("Error with 'getCensusGeo()'! 'getGeopyGeo()' method selected.")
-            self.JSON_DATA['LOCATION'] = VipData.getGeopyGeo(self)
+            if self.GAZETTEER is None:
+                print("Error with 'getCensusGeo()'! 'getGeopyGeo()' method selected.")
+                self.JSON_DATA['LOCATION'] = VipData.getGeopyGeo(self)
+            else:
+                try:
+                    print("Error with 'getCensusGeo()'! 'getGazetteerGeo()' method selected.")
+                    self.JSON_DATA['LOCATION'] = VipData.getGazetteerGeo(self)
+                except:
+                    traceback.print_exc()
+                    print("Error with 'getGazetteerGeo()'! 'getGeopyGeo()' method selected.")
+                    self.JSON_DATA['LOCATION'] = VipData.getGeopyGeo(self)
         try:
             self.REPORTS['TRACT'] = VipData.getTractValues(self)
         except:
             print("Error! 'getTractValues' method failed!")
             pass
-        print("Version:", self.__version__,"object initialized!")
+        return self.JSON_DATA['LOCATION']
 
             
     @staticmethod
@@ -171,6 +287,15 @@ class VipData:
             print(jsonName, "found!")
         return data
 
+    def getFoursquareClient(self):
+        """Returns a Foursquare API client for 'CREDENTIALS', reused across instances."""
+        key = (self.CREDENTIALS['fsid'], self.CREDENTIALS['fssecret'])
+        if key not in VipData.CLIENT_CACHE:
+            VipData.CLIENT_CACHE[key] = foursquare.Foursquare(
+                client_id = self.CREDENTIALS['fsid'], 
+                client_secret = self.CREDENTIALS['fssecret'])
+        return VipData.CLIENT_CACHE[key]
+
     def getGeopyGeo(self, agent="foursquare app"):
         """Returns a dict of geolocation data for the 'target address'."""
         geolocator = Nominatim(user_agent=agent)
@@ -214,6 +339,125 @@ class VipData:
         else:
             json = {}
         return {"json": json, "status": str(response.status_code)}
+
+    @staticmethod
+    def setGazetteerIndex(sources, index_dir="gazetteer"):
+        """
+        Description
+        -----------
+        Builds a sorted, memory-mappable index from US Census Gazetteer files
+        for use with 'getGazetteerGeo()'.
+
+        Parameters
+        ----------
+        sources: dict;  
+        Key-value pairs for tab-delimited gazetteer file paths: 
+            "zcta": "ZCTA gazetteer, e.g. '2010_Gaz_zcta_national.txt'",
+            "tracts": "Census tract gazetteer, e.g. '2010_Gaz_tracts_national.txt'"
+
+        index_dir: str;  
+        A directory for storing the index arrays. Default value: "gazetteer".
+        """
+        index_path = Path(index_dir)
+        index_path.mkdir(parents=True, exist_ok=True)
+        ## ZCTA CENTROIDS SORTED BY ZIP CODE
+        zcta = pd.read_csv(sources['zcta'], sep="\t", dtype={'GEOID': str})
+        zcta.columns = [column.strip() for column in zcta.columns]
+        zcta = zcta.sort_values('GEOID')
+        np.save(index_path / "zcta_keys.npy", zcta['GEOID'].astype(np.int32).values)
+        np.save(index_path / "zcta_coords.npy",
+            zcta[['INTPTLAT', 'INTPTLONG']].values.astype(np.float64))
+        ## TRACT CENTROIDS SORTED BY LATITUDE
+        tracts = pd.read_csv(sources['tracts'], sep="\t", dtype={'GEOID': str})
+        tracts.columns = [column.strip() for column in tracts.columns]
+        tracts = tracts.sort_values('INTPTLAT')
+        if 'POP10' not in tracts.columns:
+            ## newer gazetteer vintages omit population counts, stored as -1
+            tracts['POP10'] = -1
+        np.save(index_path / "tract_geoids.npy", tracts['GEOID'].astype(np.int64).values)
+        np.save(index_path / "tract_coords.npy",
+            tracts[['INTPTLAT', 'INTPTLONG']].values.astype(np.float64))
+        np.save(index_path / "tract_values.npy",
+            tracts[['ALAND', 'POP10']].values.astype(np.int64))
+        VipData.GAZETTEER_CACHE.pop(str(index_path), None)
+        print(index_dir, "gazetteer index created!")
+        return str(index_path)
+
+    def getGazetteerGeo(self, index_dir=None, window=0.25):
+        """
+        Description
+        -----------
+        Returns offline geo data for the ZIP code of 'ADDRESS' from a local
+        gazetteer index, shaped like the 'getCensusGeo()' response.
+
+        Parameters
+        ----------
+        index_dir: str;  
+        A directory created by 'setGazetteerIndex()'. Defaults to 'GAZETTEER'.
+
+        window: float;  
+        Latitude band in degrees searched for the nearest tract centroid.
+        Default value: 0.25.
+        """
+        if index_dir is None:
+            index_dir = self.GAZETTEER
+        index_dir = str(Path(index_dir))
+        if index_dir not in VipData.GAZETTEER_CACHE:
+            index_path = Path(index_dir)
+            VipData.GAZETTEER_CACHE[index_dir] = {
+                name: np.load(index_path / (name + ".npy"), mmap_mode='r')
+                for name in ['zcta_keys', 'zcta_coords', 'tract_geoids', 
+                    'tract_coords', 'tract_values']
+                }
+        index = VipData.GAZETTEER_CACHE[index_dir]
+        ## only a trailing ZIP code is accepted, so house numbers are never read
+        ## as one, e.g. "1 Main St, Springfield, IL 62701-1234, USA"
+        match = re.search(r"\b(\d{5})(?:-\d{4})?\s*(?:,?\s*(?:US|USA|United States))?\s*$", 
+            self.ADDRESS, flags=re.IGNORECASE)
+        if match is None:
+            raise ValueError("No trailing ZIP code found in address: " + self.ADDRESS)
+        zip_text = match.group(1)
+        zip_code = int(zip_text)
+        position = int(np.searchsorted(index['zcta_keys'], zip_code))
+        if position >= len(index['zcta_keys']) \
+            or index['zcta_keys'][position] != zip_code:
+            raise KeyError("ZIP code not found in gazetteer: " + zip_text)
+        lat, lng = (float(value) for value in index['zcta_coords'][position])
+        ## NEAREST TRACT CENTROID WITHIN A LATITUDE BAND OF THE ZIP CENTROID
+        tract_lats = index['tract_coords'][:, 0]
+        low = int(np.searchsorted(tract_lats, lat - window, side='left'))
+        high = int(np.searchsorted(tract_lats, lat + window, side='right'))
+        if high <= low:
+            low, high = 0, len(tract_lats)
+        candidates = np.asarray(index['tract_coords'][low:high])
+        dlat = candidates[:, 0] - lat
+        dlng = (candidates[:, 1] - lng) * np.cos(np.radians(lat))
+        nearest = low + int(np.argmin(dlat**2 + dlng**2))
+        geoid = str(int(index['tract_geoids'][nearest])).zfill(11)
+        land_area, population = (int(value) for value in index['tract_values'][nearest])
+        if population < 0:
+            population = None
+        json = {
+            "result": {
+                "addressMatches": [{
+                    "matchedAddress": ("{} (ZCTA {} centroid)").format(
+                        self.ADDRESS, zip_text),
+                    "coordinates": {"x": lng, "y": lat},
+                    "geographies": {
+                        "Census Tracts": [{
+                            "GEOID": geoid,
+                            "STATE": geoid[:2],
+                            "COUNTY": geoid[2:5],
+                            "TRACT": geoid[5:],
+                            "AREALAND": land_area,
+                            "POP100": population
+                            }]
+                        }
+                    }]
+                }
+            }
+        print("Gazetteer match found for ZIP code:", zip_text)
+        return {"json": json, "status": "gazetteer"}
     
     def getTractValues(self):
         """
@@ -238,6 +482,16 @@ class VipData:
                 "state_id": state_id, "land_area": land_area, 
                 "tract_pop": population
                 }
+            if population is None:
+                ## gazetteer vintages without population cannot size a radius
+                TRACT_DATA = {
+                    "tractid": tract_id, "countyid": county_id, 
+                    "stateid": state_id, "landarea": land_area, 
+                    "tractpop100": None, "RADIUS": 4250
+                    }
+                print("Tract population unavailable! Default radius selected:", 
+                    TRACT_DATA["RADIUS"])
+                return TRACT_DATA
             print("Census data found...")
             api_key = self.CREDENTIALS['censuskey']
             area= float(census_vals['land_area'])
@@ -324,9 +578,70 @@ class VipData:
         return TRACT_DATA
 
     
+    def getSearchLatLng(self, latlng=None):
+        """
+        Description
+        -----------
+        Returns the search coordinates for 'ADDRESS' as a "lat,lng" string.
+
+        Parameters
+        ----------
+        latlng: str;  
+        Latitude, longitude as a comma-separated string values.  
+        """
+        if isinstance(latlng,str):
+            ll = latlng
+        else:
+            try:
+                ## fetches coords from censusgeo results
+                coords = tuple(self.JSON_DATA['LOCATION']['json']['result']\
+                    ['addressMatches'][0]['coordinates'].values())
+                ll = ("{},{}").format(coords[1],coords[0])
+            except (KeyError, IndexError):
+                ## fetches lat/lon values from geopyGeo results if above not present
+                self.JSON_DATA['LOCATION'] = VipData.getGeopyGeo(self)
+                lat = self.JSON_DATA['LOCATION']['json']['lat']
+                lon = self.JSON_DATA['LOCATION']['json']['lon']
+                ll = ("{},{}").format(lat, lon)
+        return ll
+
+    def getCategoryIds(self, categories=None):
+        """
+        Description
+        -----------
+        Returns a list of 'category id' numbers to search.
+
+        Parameters
+        ----------
+        categories: str, list;  
+        Accepts a 'category id' as a string value,
+        or 'all' to search each key in VENUE_CATEGORIES,
+        or a list of specific 'category id' numbers to search.  
+        """
+        if categories is None:
+            ## 'Nightlife' CATEGORY ID  : "4d4b7105d754a06376d81259"
+            ## 'Food' CATEGORY ID       : '4d4b7105d754a06374d81259' 
+            categories = ['4d4b7105d754a06376d81259', '4d4b7105d754a06374d81259']
+        elif isinstance(categories,str) and categories=="all":
+            categories = list(self.VENUE_CATEGORIES['CATEGORIES'].keys())
+        elif isinstance(categories,str):
+            categories = [categories]
+        else:
+            pass
+        return categories
+
+    @staticmethod
+    def getHaversine(lat1, lng1, lat2, lng2):
+        """Returns the great-circle distance in meters between coordinates."""
+        lat1, lng1, lat2, lng2 = (np.radians(value) for value in (lat1, lng1, lat2, lng2))
+        a = np.sin((lat2 - lat1) / 2)**2 \
+            + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2)**2
+        return 2 * 6371008.8 * np.arcsin(np.sqrt(a))
+
     def getVenues(self, latlng=None, query="", radius=None,  
                   intent="browse", limit=50, 
-                  categories=None):                
+                  categories=None, adaptive=False, target=30, max_calls=12,
+                  merge=False):                
         """
         Description
         -----------
@@ -354,37 +669,31 @@ class VipData:
         or 'all' to search each key in VENUE_CATEGORIES,
         or a list of specific 'category id' numbers to search.  
 
+        adaptive: bool;  
+        Searches with 'getAdaptiveVenues()' instead of a fixed radius.
+        'False' by default.
+
+        target: int;  
+        The competitor count sought in adaptive mode. Default value: 30.
+
+        max_calls: int;  
+        The venue query budget in adaptive mode. Default value: 12.
+
+        merge: bool;  
+        Adds the results to 'VENUE_STORE' instead of replacing it.
+        'False' by default.
+
         See the Foursquare API docs for more details on query parameters.
         """
+        if adaptive == True:
+            return VipData.getAdaptiveVenues(self, target=target, 
+                max_calls=max_calls, latlng=latlng, query=query, radius=radius,
+                intent=intent, limit=limit, categories=categories, merge=merge)
         if radius is None:
             radius = self.REPORTS['TRACT']['RADIUS']
-        if isinstance(latlng,str):
-            ll = latlng
-        else:
-            try:
-                ## fetches coords from censusgeo results
-                coords = tuple(self.JSON_DATA['LOCATION']['json']['result']\
-                    ['addressMatches'][0]['coordinates'].values())
-                ll = ("{},{}").format(coords[1],coords[0])
-            except (KeyError, IndexError):
-                ## fetches lat/lon values from geopyGeo results if above not present
-                self.JSON_DATA['LOCATION'] = VipData.getGeopyGeo(self)
-                lat = self.JSON_DATA['LOCATION']['json']['lat']
-                lon = self.JSON_DATA['LOCATION']['json']['lon']
-                ll = ("{},{}").format(lat, lon)
-        if categories is None:
-            ## 'Nightlife' CATEGORY ID  : "4d4b7105d754a06376d81259"
-            ## 'Food' CATEGORY ID       : '4d4b7105d754a06374d81259' 
-            categories = ['4d4b7105d754a06376d81259', '4d4b7105d754a06374d81259']
-        elif isinstance(categories,str):
-            categories = [categories]
-        elif isinstance(categories,str) and categories=="all":
-            categories = list(self.VENUE_CATEGORIES['CATEGORIES'].keys())
-        else:
-            pass
-        client = foursquare.Foursquare(
-            client_id = self.CREDENTIALS['fsid'], 
-            client_secret = self.CREDENTIALS['fssecret'])
+        ll = VipData.getSearchLatLng(self, latlng)
+        categories = VipData.getCategoryIds(self, categories)
+        client = VipData.getFoursquareClient(self)
         responses ={}
         for category in categories:
             params = {
@@ -397,79 +706,299 @@ class VipData:
             }
             responses[category] = client.venues.search(params)
         self.JSON_DATA['VENUES'] = responses
+        search = ("{}@{}m{}").format(ll, radius, 
+            ("?" + str(query)) if query else "")
+        if merge == False:
+            self.VENUE_STORE = {}
+        VipData.setVenueStore(self, responses, search=search)
         print("Venue query operation complete!")
         return #responses
 
-    def setVenuesDf(self):
+    def getAdaptiveVenues(self, target=30, tolerance=0.2, max_calls=12, 
+        latlng=None, query="", radius=None, intent="browse", limit=50, 
+        categories=None, min_radius=250.0, max_radius=50000.0, merge=False):
         """
         Description
         -----------
-        A method for extracting a dataframe of from 'VENUES' json.
+        Method for returning raw venue data for 'ADDRESS' within a search
+        radius adjusted until a target competitor count is reached.
+
+        Parameters
+        ----------
+        target: int;  
+        The number of unique venues sought. Default value: 30.
+
+        tolerance: float;  
+        Accepted relative deviation from 'target'. Default value: 0.2.
+
+        max_calls: int;  
+        Maximum number of venue queries, one per category per radius. Must
+        cover at least one search of every category. Default value: 12.
+
+        radius: float, int;  
+        The starting search radius in meters. Defaults to the tract radius.
+
+        min_radius, max_radius: float;  
+        Bounds for the search radius in meters. Default values: 250, 50000.
+
+        merge: bool;  
+        Adds the results to 'VENUE_STORE' instead of replacing it.
+        'False' by default.
+
+        See 'getVenues()' for the remaining query parameters.
         """
-        json = self.JSON_DATA['VENUES']
-        venue_list = []
-        for category in json:
-            category_idn = category
-            venues = json[category]['venues']
-            for venue in venues:
+        if radius is None:
+            radius = self.REPORTS['TRACT'].get('RADIUS', 4250)
+        radius = float(min(max(radius, min_radius), max_radius))
+        ll = VipData.getSearchLatLng(self, latlng)
+        lat, lng = (float(value) for value in ll.split(","))
+        categories = VipData.getCategoryIds(self, categories)
+        if max_calls < len(categories):
+            raise ValueError(("'max_calls' of {} cannot cover one search of {} "
+                "categories.").format(max_calls, len(categories)))
+        client = VipData.getFoursquareClient(self)
+        ## QUERIED RESPONSES PER CATEGORY AS (RADIUS, RESPONSE, SATURATED)
+        searches = {category: [] for category in categories}
+        low, high = min_radius, max_radius
+        calls = 0
+        trail = []
+        while True:
+            ## a wider, unsaturated search already holds every venue in a
+            ## smaller circle, so only the remaining categories are queried
+            needed = [category for category in categories 
+                if not any(r >= radius and not saturated 
+                    for r, response, saturated in searches[category])]
+            if calls + len(needed) > max_calls:
+                print("Venue query budget reached.")
+                break
+            for category in needed:
+                params = {
+                    'query': str(query), 
+                    'll': ll,
+                    'categoryId': category, 
+                    'radius': radius,
+                    'intent': str(intent), 
+                    'limit': limit
+                }
+                response = client.venues.search(params)
+                searches[category] += [
+                    (radius, response, len(response['venues']) >= limit)]
+            calls += len(needed)
+            responses = VipData.getVenuesWithin(self, searches, radius, lat, lng)
+            count = len({venue['id'] for category in responses 
+                for venue in responses[category]['venues']})
+            saturated = any(saturated for category in categories 
+                for r, response, saturated in searches[category] if r == radius)
+            trail += [{"radius": radius, "count": count, "saturated": saturated}]
+            print(("Radius {:.0f}m: {} venues{}.").format(
+                radius, count, " (saturated)" if saturated else ""))
+            if saturated or count > target * (1 + tolerance):
+                high = radius
+                estimate = radius / 2 if saturated \
+                    else radius * (target / count)**0.5
+            elif count < target * (1 - tolerance):
+                low = radius
+                estimate = radius * 2 if count == 0 \
+                    else radius * (target / count)**0.5
+            else:
+                break
+            ## venue counts grow with area, so estimates scale by sqrt
+            if not low < estimate < high:
+                estimate = (low * high)**0.5
+            if abs(estimate - radius) < 0.05 * radius:
+                break
+            radius = estimate
+        if len(trail) == 0:
+            raise RuntimeError("No venue searches were made within 'max_calls'.")
+        ## CLOSEST UNSATURATED RADIUS TO TARGET, ELSE THE SMALLEST TRIED
+        unsaturated = [trial for trial in trail if not trial['saturated']]
+        if len(unsaturated) > 0:
+            chosen = min(unsaturated, key=lambda trial: abs(trial['count'] - target))
+        else:
+            chosen = min(trail, key=lambda trial: trial['radius'])
+        responses = VipData.getVenuesWithin(self, searches, chosen['radius'], lat, lng)
+        self.JSON_DATA['VENUES'] = responses
+        search = ("{}@{:.0f}m{}").format(ll, chosen['radius'], 
+            ("?" + str(query)) if query else "")
+        if merge == False:
+            self.VENUE_STORE = {}
+        VipData.setVenueStore(self, responses, search=search)
+        ## THE TRACT RADIUS IS LEFT AS THE CENSUS BASED DEFAULT
+        self.REPORTS['TRACT']['ADAPTIVE_RADIUS'] = chosen['radius']
+        self.REPORTS['TRACT']['RADIUS_SEARCH'] = {
+            "target": target, "calls": calls, "trail": trail
+            }
+        print("Adaptive radius selected:", chosen['radius'])
+        print("Venue query operation complete!")
+        return #responses
+
+    def getVenuesWithin(self, searches, radius, lat, lng):
+        """
+        Description
+        -----------
+        Returns venue responses per category limited to a radius, taken from
+        the smallest covering search made by 'getAdaptiveVenues()'.
+
+        Parameters
+        ----------
+        searches: dict;  
+        Lists of (radius, response, saturated) tuples keyed by 'category id'.
+
+        radius: float;  
+        A search radius in meters.
+
+        lat, lng: float;  
+        The search coordinates.
+        """
+        responses = {}
+        for category in searches:
+            covering = [(r, response) for r, response, saturated 
+                in searches[category] if r >= radius]
+            if len(covering) == 0:
+                continue
+            response = min(covering, key=lambda search: search[0])[1]
+            venues = []
+            for venue in response['venues']:
                 try:
-                    venue_name = venue['name']
+                    distance = venue['location']['distance']
                 except KeyError:
-                    venue_name = None
+                    distance = VipData.getHaversine(lat, lng, 
+                        venue['location']['lat'], venue['location']['lng'])
+                if distance <= radius:
+                    venues += [venue]
+            responses[category] = dict(response, venues=venues)
+        return responses
+
+    def setVenueStore(self, venues=None, search=None):
+        """
+        Description
+        -----------
+        A method for merging venue query responses into 'VENUE_STORE', a
+        canonical record of each venue keyed by venue id with every category
+        and search it was returned under.
+
+        Parameters
+        ----------
+        venues: dict;  
+        Venue query responses keyed by 'category id'. Defaults to 'VENUES' json.
+
+        search: str;  
+        A label for the search that returned the venues. Defaults to 'ADDRESS'.
+        """
+        if venues is None:
+            venues = self.JSON_DATA['VENUES']
+        if search is None:
+            search = self.ADDRESS
+        store = self.VENUE_STORE
+        for category in venues:
+            for venue in venues[category]['venues']:
                 try:
                     venue_id = venue['id']
                 except KeyError:
-                    venue_id = None
-                try:
-                    venue_address = venue['location']['address']
-                except KeyError:
-                    venue_address = None
-                try:
-                    venue_lat = venue['location']['lat']
-                except KeyError:
-                    venue_lat = None
-                try:
-                    venue_lng = venue['location']['lng']
-                except KeyError:
-                    venue_lng = None
-                try:
-                    venue_referral_id = venue["referralId"]
-                except KeyError:
-                    venue_referral_id = None
-                try:
-                    delivery_provider = venue['delivery']['provider']['name']
-                except KeyError:
-                    delivery_provider = None
-                try:
-                    delivery_url = venue['delivery']['url']
-                except KeyError:
-                    delivery_url = None
-                try:
-                    vid = str(venue_id)
-                    ## CODE FOR FOURSQUARE REFERRAL WITHOUT CLIENT_ID:
-                    string_url = ("https://foursquare.com/v/{}").format(vid)
-                    ## CODE FOR FOURSQUARE REFERRAL WITH CLIENT_ID:
-                    # cid = self.CREDENTIALS['fsid']
-                    # string_url = ("https://foursquare.com/v/{}&ref={}").format(vid,cid)
-                except:
-                    string_url = None
-                venue_list += [{
-                    "venue_name": venue_name,
-                    "venue_id": venue_id,
-                    "category_idn": category_idn,
-                    "venue_address": venue_address,
-                    "venue_lat": venue_lat,
-                    "venue_lng": venue_lng,
-                    "venue_referral_id": venue_referral_id,
-                    "delivery_provider": delivery_provider,
-                    "delivery_url": delivery_url,
-                    "attribution_link": string_url
-                }]
+                    continue
+                if venue_id in store:
+                    entry = store[venue_id]
+                    entry['venue'] = venue
+                else:
+                    entry = store[venue_id] = {
+                        "venue": venue, "categories": [], "searches": []
+                        }
+                if category not in entry['categories']:
+                    entry['categories'] += [category]
+                if search not in entry['searches']:
+                    entry['searches'] += [search]
+        return store
+
+    def getVenueStore(self):
+        """
+        Description
+        -----------
+        Returns 'VENUE_STORE', building it from 'VENUES' json when empty.
+        """
+        if len(self.VENUE_STORE) == 0 and self.JSON_DATA['VENUES'] is not None:
+            VipData.setVenueStore(self)
+        return self.VENUE_STORE
+
+    def setVenuesDf(self, compact=False):
+        """
+        Description
+        -----------
+        A method for extracting a dataframe of from 'VENUES' json.
+
+        Parameters
+        ----------
+        compact: bool;  
+        Converts columns to memory-compact dtypes. 'False' by default.
+        """
+        store = VipData.getVenueStore(self)
+        venue_list = []
+        for entry in store.values():
+            venue = entry['venue']
+            ## first category the venue was returned under
+            category_idn = entry['categories'][0]
+            category_ids = ",".join(entry['categories'])
+            try:
+                venue_name = venue['name']
+            except KeyError:
+                venue_name = None
+            try:
+                venue_id = venue['id']
+            except KeyError:
+                venue_id = None
+            try:
+                venue_address = venue['location']['address']
+            except KeyError:
+                venue_address = None
+            try:
+                venue_lat = venue['location']['lat']
+            except KeyError:
+                venue_lat = None
+            try:
+                venue_lng = venue['location']['lng']
+            except KeyError:
+                venue_lng = None
+            try:
+                venue_referral_id = venue["referralId"]
+            except KeyError:
+                venue_referral_id = None
+            try:
+                delivery_provider = venue['delivery']['provider']['name']
+            except KeyError:
+                delivery_provider = None
+            try:
+                delivery_url = venue['delivery']['url']
+            except KeyError:
+                delivery_url = None
+            try:
+                vid = str(venue_id)
+                ## CODE FOR FOURSQUARE REFERRAL WITHOUT CLIENT_ID:
+                string_url = ("https://foursquare.com/v/{}").format(vid)
+                ## CODE FOR FOURSQUARE REFERRAL WITH CLIENT_ID:
+                # cid = self.CREDENTIALS['fsid']
+                # string_url = ("https://foursquare.com/v/{}&ref={}").format(vid,cid)
+            except:
+                string_url = None
+            venue_list += [{
+                "venue_name": venue_name,
+                "venue_id": venue_id,
+                "category_idn": category_idn,
+                "category_ids": category_ids,
+                "venue_address": venue_address,
+                "venue_lat": venue_lat,
+                "venue_lng": venue_lng,
+                "venue_referral_id": venue_referral_id,
+                "delivery_provider": delivery_provider,
+                "delivery_url": delivery_url,
+                "attribution_link": string_url
+            }]
         df = pd.DataFrame.from_records(
             venue_list, index=None, exclude=None, coerce_float=False, 
-            columns=['venue_name',"venue_id",'category_idn', 'venue_address', \
-                'venue_lat', 'venue_lng', "venue_referral_id", "delivery_provider", 
+            columns=['venue_name',"venue_id",'category_idn', 'category_ids', \
+                'venue_address', 'venue_lat', 'venue_lng', "venue_referral_id", 
+                "delivery_provider", 
                 "delivery_url", "attribution_link"])
+        if compact == True:
+            df = VipData.setCompactDf(self, df, 'VENUES')
         self.REPORTS['VENUES'] = df
         return df
 
@@ -484,7 +1013,7 @@ class VipData:
         save_map: bool;  
         Indicates whether to output the venue location map as an html.
         """
-        venue_data = self.JSON_DATA['VENUES']
+        store = VipData.getVenueStore(self)
         ## below is where venues map breaks with alt location method
         search_address = self.JSON_DATA['LOCATION']['json']['result']\
             ['addressMatches'][0]['matchedAddress']
@@ -499,38 +1028,50 @@ class VipData:
         folium.CircleMarker(
             search_coords, popup = search_address, 
             tooltip = search_address).add_to(m)
-        for category in venue_data:
-            for venue in venue_data[category]['venues']:
-                venue_name = venue['name']
-                venue_id = venue['id']
-                venue_type = venue['categories'][0]['name']
-                venue_lat = venue['location']['lat']
-                venue_lng = venue['location']['lng']
-                try:
-                    venue_icon = self.VENUE_CATEGORIES['CATEGORIES'][category][1]
-                    venue_icon_color = self.VENUE_CATEGORIES['CATEGORIES'][category][2]
-                except KeyError:
-                    venue_icon = "glyphicon glyphicon-search"
-                    venue_icon_color = 'lightblue'
-                attribution_url = (
-                    "<a href=https://foursquare.com/v/{}>{}</a>").format(
-                        venue_id, 
-                        venue_type)
-                venue_coords = (venue_lat, venue_lng)
-                folium.Marker(
-                    venue_coords, 
-                    popup = attribution_url, 
-                    tooltip = venue_name,
-                    icon = folium.Icon(
-                        icon= venue_icon,
-                        color= venue_icon_color)
-                    ).add_to(m)
+        for entry in store.values():
+            venue = entry['venue']
+            category = entry['categories'][0]
+            venue_name = venue['name']
+            venue_id = venue['id']
+            venue_type = venue['categories'][0]['name']
+            venue_lat = venue['location']['lat']
+            venue_lng = venue['location']['lng']
+            try:
+                venue_icon = self.VENUE_CATEGORIES['CATEGORIES'][category][1]
+                venue_icon_color = self.VENUE_CATEGORIES['CATEGORIES'][category][2]
+            except KeyError:
+                venue_icon = "glyphicon glyphicon-search"
+                venue_icon_color = 'lightblue'
+            attribution_url = (
+                "<a href=https://foursquare.com/v/{}>{}</a>").format(
+                    venue_id, 
+                    venue_type)
+            venue_coords = (venue_lat, venue_lng)
+            folium.Marker(
+                venue_coords, 
+                popup = attribution_url, 
+                tooltip = venue_name,
+                icon = folium.Icon(
+                    icon= venue_icon,
+                    color= venue_icon_color)
+                ).add_to(m)
         self.REPORTS['MAP'] = m
         if save_map == True:
             m.save(self.OUTPUT_LABELS['foliumLabel'])
         return m
 
-    def getMenus(self,venues=None):
+    def getVenuesMap(self):
+        """
+        Description
+        -----------
+        Returns the venue location map, rebuilding it without saving when it
+        was not kept, e.g. after unpickling.
+        """
+        if self.REPORTS['MAP'] is None:
+            VipData.setVenuesMap(self, save_map=False)
+        return self.REPORTS['MAP']
+
+    def getMenus(self,venues=None,resume=False):
         """
         Description
         -----------
@@ -540,34 +1081,40 @@ class VipData:
         ----------
         venues: list;  
         A list of venue id numbers to query for menu data.
+        Defaults to every venue in 'VENUE_STORE'.
+
+        resume: bool;  
+        Keeps menus already in 'MENUS' json and only queries the rest. Query
+        errors are raised after storing the menus received so far.
+        'False' by default.
         """
         if venues is None:
-            venues_dict = self.JSON_DATA['VENUES']
-        client = foursquare.Foursquare(
-            client_id = self.CREDENTIALS['fsid'], 
-            client_secret = self.CREDENTIALS['fssecret'])
-        unique_ids = []
+            venues = list(VipData.getVenueStore(self).keys())
+        client = VipData.getFoursquareClient(self)
+        ## MENUS ARE KEYED BY VENUE ID
         menus = {}
+        if resume == True and self.JSON_DATA['MENUS'] is not None:
+            menus = dict(self.JSON_DATA['MENUS'])
         try:
-            for key in venues_dict:
-                print("Querying menu data for key:", key)
-                for venue in venues_dict[key]['venues']:
-                    venue_name = venue['name']
-                    venue_id = venue['id']
-                    if (venue_id in unique_ids):
-                        pass
-                    else:
-                        unique_ids += [venue_id]
-                        response = client.venues.menu(venue_id)
-                        menus[venue_name] = response
+            print("Querying menu data for", len(venues), "venues.")
+            for venue_id in venues:
+                if venue_id in menus:
+                    pass
+                else:
+                    response = client.venues.menu(venue_id)
+                    menus[venue_id] = response
         except:
+            self.JSON_DATA['MENUS'] = menus
+            if resume == True:
+                raise
             traceback.print_exc()
         self.JSON_DATA['MENUS'] = menus
         print("Menu query operation complete!")
         return #menus
 
     def setMenusDf(self, records=None, drop_na=False, \
-        iter_limit=None, drop_menus_with=[]):
+        iter_limit=None, drop_menus_with=[], compact=False, drop_json=False, 
+        index=False):
         """
         Description
         -----------
@@ -579,18 +1126,47 @@ class VipData:
         A list of menu query responses.  
 
         drop_na: bool;  
-        Drops 'NoneTypes' from dataframe. 'False' by default.  
+        Drops rows missing a venue name, price or attribution, the fields
+        without placeholder text, so compact mode drops the same rows.
+        'False' by default.  
 
         iter_limit: int;  
         Maximum number of observations per dataframe. 'None' by default.
 
         drop_menus_with: list;  
         A list of strings by which to filter out menus containing those strings.
+
+        compact: bool;  
+        Converts columns to memory-compact dtypes and leaves missing names and
+        descriptions empty instead of filling placeholder text. 'False' by default.
+
+        drop_json: bool;  
+        Releases the raw 'MENUS' json once it is flattened. 'False' by default.
+
+        index: bool;  
+        Builds 'MENU_INDEX' for 'searchMenus()' while flattening. Otherwise 
+        'MENU_INDEX' is cleared and rebuilt by the next search.
+        'False' by default.
         """
         if records is None:
             records = self.JSON_DATA['MENUS']
+        if compact == True:
+            placeholders = dict.fromkeys(VipData.MENU_PLACEHOLDERS, None)
+        else:
+            placeholders = VipData.MENU_PLACEHOLDERS
+        store = VipData.getVenueStore(self)
+        ## row numbers of an earlier index do not match the rebuilt frame
+        self.MENU_INDEX = None
+        postings = {}
         bulk_items = []
         for key in records:
+            ## records are keyed by venue id, or by venue name in older json
+            if key in store:
+                venue_id = key
+                venue_name = store[key]['venue'].get('name')
+            else:
+                venue_id = None
+                venue_name = key
             if records[key]['menu']['menus']['count'] > 0:
                 menus = records[key]['menu']['menus']['items']
                 for menu in menus:
@@ -603,19 +1179,19 @@ class VipData:
                                     try:
                                         menu_name = menu['name']
                                     except KeyError:
-                                        menu_name = "No menu title"
+                                        menu_name = placeholders['menu']
                                     try:
                                         section_name = section['name']
                                     except KeyError:
-                                        section_name = "No section title"
+                                        section_name = placeholders['section']
                                     try:
                                         item_name = item['name']
                                     except KeyError:
-                                        item_name = "No item name"
+                                        item_name = placeholders['name']
                                     try:
                                         item_desc = item['description']
                                     except KeyError:
-                                        item_desc = "No item description"
+                                        item_desc = placeholders['desc']
                                     try:
                                         item_price = float(item['price'])
                                     except (KeyError, ValueError):
@@ -625,8 +1201,15 @@ class VipData:
                                             ['provider']['attributionLink']
                                     except KeyError:
                                         attribution_link = None
+                                    if index == True:
+                                        row = len(bulk_items)
+                                        for token in VipData.getTokens(
+                                            section.get('name'), item.get('name'), 
+                                            item.get('description')):
+                                            postings.setdefault(token, []).append(row)
                                     bulk_items += [{
-                                        'venue_name': key,
+                                        'venue_name': venue_name,
+                                        'venue_id': venue_id,
                                         'menu_name': menu_name,
                                         'section_name': section_name,
                                         'item_name': item_name,
@@ -646,21 +1229,33 @@ class VipData:
         try:
             df = pd.DataFrame.from_records(
                 bulk_items, index=None, exclude=None, coerce_float=True, 
-                nrows=iter_limit, columns=['venue_name', 'menu_name', 
+                nrows=iter_limit, columns=['venue_name', 'venue_id', 'menu_name', 
                 'section_name', 'item_name', 'item_desc', 'item_price', 
                 'attribution'])
             if drop_na==True:
-                df.dropna(inplace=True)
+                df.dropna(subset=['venue_name', 'item_price', 'attribution'], 
+                    inplace=True)
             if isinstance(drop_menus_with, list) and len(drop_menus_with)>0:
                 filter_index_list = []
-                for menu_name in df['menu_name'].iteritems():
+                for menu_name in df['menu_name'].items():
                     menu_string = menu_name[1]
+                    if not isinstance(menu_string, str):
+                        continue
                     for string in drop_menus_with:
                         if str(string) in menu_string:
                             filter_index_list += [menu_name[0]]
                         else:
                             pass
                 df.drop(filter_index_list, inplace=True)
+            if compact == True:
+                df = VipData.setCompactDf(self, df, 'MENUS')
+            if index == True:
+                self.MENU_INDEX = VipData.getMenuIndex(postings,
+                    [item['item_price'] for item in bulk_items],
+                    [item['venue_id'] for item in bulk_items])
+            if drop_json == True:
+                self.JSON_DATA['MENUS'] = None
+                print("Raw 'MENUS' json released.")
             self.REPORTS['MENUS'] = df
             return df
         except TypeError:
@@ -668,6 +1263,202 @@ class VipData:
             print("Error! Failed to create dataframe.")
             pass
 
+    def setCompactDf(self, df, label=None, max_unique_ratio=0.5):
+        """
+        Description
+        -----------
+        Returns a copy of a dataframe using memory-compact dtypes: categoricals
+        for repeated strings, nullable strings otherwise and float32 prices.
+
+        Parameters
+        ----------
+        df: DataFrame;  
+        A dataframe from 'REPORTS'.
+
+        label: str;  
+        A key for recording memory usage in 'REPORTS['MEMORY']'.
+
+        max_unique_ratio: float;  
+        Upper ratio of unique to total values for a categorical column.
+        Default value: 0.5.
+        """
+        memory_before = int(df.memory_usage(deep=True).sum())
+        df = df.copy()
+        for column in df.columns:
+            if column.endswith('price'):
+                df[column] = df[column].astype(np.float32)
+            elif df[column].dtype == object or pd.api.types.is_string_dtype(df[column]):
+                if df[column].nunique() <= max_unique_ratio * len(df):
+                    df[column] = df[column].astype('category')
+                else:
+                    df[column] = df[column].astype('string')
+        memory_after = int(df.memory_usage(deep=True).sum())
+        if label is not None:
+            self.REPORTS['MEMORY'][label] = {
+                "before": memory_before, "after": memory_after
+                }
+        print(("Memory usage for '{}': {:,} bytes before, {:,} bytes after.").format(
+            label, memory_before, memory_after))
+        return df
+
+    @staticmethod
+    def getTokens(*texts):
+        """Returns the set of lowercase word tokens found in the given texts."""
+        tokens = set()
+        for text in texts:
+            if isinstance(text, str):
+                tokens.update(re.findall(r"[a-z0-9]+", text.lower()))
+        return tokens
+
+    @staticmethod
+    def getMenuIndex(postings, prices, venue_ids):
+        """
+        Description
+        -----------
+        Returns a menu search index with each token's posting list of menu
+        dataframe rows sorted by item price.
+
+        Parameters
+        ----------
+        postings: dict;  
+        Lists of row numbers keyed by token.
+
+        prices: list;  
+        Item prices by row number.
+
+        venue_ids: list;  
+        Venue ids by row number.
+        """
+        prices = np.array(prices, dtype=np.float64)
+        venue_codes, venues = pd.factorize(pd.Series(venue_ids, dtype=object))
+        tokens = {}
+        for token, rows in postings.items():
+            rows = np.array(rows, dtype=np.int64)
+            ## missing prices sort last
+            order = np.argsort(prices[rows], kind='stable')
+            tokens[token] = (rows[order], prices[rows][order])
+        order = np.argsort(prices, kind='stable')
+        return {
+            "tokens": tokens,
+            "all": (order.astype(np.int64), prices[order]),
+            "venue_codes": venue_codes.astype(np.int32),
+            "venues": list(venues)
+            }
+
+    def setMenuIndex(self, menus=None):
+        """
+        Description
+        -----------
+        A method for building 'MENU_INDEX' from an existing menu dataframe.
+
+        Parameters
+        ----------
+        menus: DataFrame;  
+        A menu dataframe. Defaults to 'REPORTS['MENUS']'.
+        """
+        if menus is None:
+            menus = self.REPORTS['MENUS']
+        if menus is None:
+            raise RuntimeError("No menu dataframe found! Run 'setMenusDf()' first.")
+        placeholders = set(VipData.MENU_PLACEHOLDERS.values())
+        ## rows are addressed by dataframe label, as in 'setMenusDf()'
+        size = int(menus.index.max()) + 1 if len(menus) > 0 else 0
+        prices = [None] * size
+        venue_ids = [None] * size
+        postings = {}
+        for row, section_name, item_name, item_desc, item_price, venue_id in zip(
+            menus.index, menus['section_name'], menus['item_name'], 
+            menus['item_desc'], menus['item_price'], menus['venue_id']):
+            prices[row] = item_price
+            venue_ids[row] = venue_id
+            for token in VipData.getTokens(*(text for text in 
+                (section_name, item_name, item_desc) if text not in placeholders)):
+                postings.setdefault(token, []).append(row)
+        self.MENU_INDEX = VipData.getMenuIndex(postings, prices, venue_ids)
+        return self.MENU_INDEX
+
+    def searchMenus(self, keywords=None, min_price=None, max_price=None, 
+        venues=None, max_distance=None, get_stats=False):
+        """
+        Description
+        -----------
+        Returns the menu dataframe rows matching every keyword within a price
+        range, using 'MENU_INDEX'.
+
+        Parameters
+        ----------
+        keywords: str, list;  
+        Words that must all appear in the item name, description or section.
+        Keywords without any searchable words match no items.
+
+        min_price, max_price: float;  
+        An inclusive item price range. Unbounded by default.
+
+        venues: list;  
+        A list of venue id numbers to search.
+
+        max_distance: float;  
+        A maximum venue distance from 'ADDRESS' in meters.
+
+        get_stats: bool;  
+        Passes the matches to 'getMenuStats()' and returns its results.
+        'False' by default.
+        """
+        if self.REPORTS['MENUS'] is None:
+            raise RuntimeError("No menu dataframe found! Run 'setMenusDf()' first.")
+        if self.MENU_INDEX is None:
+            VipData.setMenuIndex(self)
+        index = self.MENU_INDEX
+        low = -np.inf if min_price is None else float(min_price)
+        high = np.inf if max_price is None else float(max_price)
+        if isinstance(keywords, str):
+            keywords = [keywords]
+        tokens = VipData.getTokens(*keywords) if keywords else set()
+        matches = None
+        ## NO KEYWORDS SEARCHES ALL ROWS
+        for token in (tokens if keywords else [None]):
+            if token is None:
+                rows, prices = index['all']
+            else:
+                rows, prices = index['tokens'].get(token, 
+                    (np.empty(0, dtype=np.int64), np.empty(0)))
+            ## PRICE RANGE AS A SLICE OF THE PRICE-SORTED POSTING LIST,
+            ## UNPRICED ITEMS AT THE END ARE KEPT WHEN UNBOUNDED
+            if min_price is not None or max_price is not None:
+                rows = rows[np.searchsorted(prices, low, side='left'):
+                    np.searchsorted(prices, high, side='right')]
+            if matches is None:
+                matches = np.sort(rows)
+            else:
+                matches = np.intersect1d(matches, rows, assume_unique=True)
+        if matches is None:
+            matches = np.empty(0, dtype=np.int64)
+        if venues is not None or max_distance is not None:
+            allowed = np.ones(len(index['venues']), dtype=bool)
+            if venues is not None:
+                allowed &= np.isin(np.array(index['venues'], dtype=object), list(venues))
+            if max_distance is not None:
+                store = VipData.getVenueStore(self)
+                lat, lng = (float(value) for value in 
+                    VipData.getSearchLatLng(self).split(","))
+                for code, venue_id in enumerate(index['venues']):
+                    try:
+                        location = store[venue_id]['venue']['location']
+                        distance = VipData.getHaversine(
+                            lat, lng, location['lat'], location['lng'])
+                    except (KeyError, TypeError):
+                        distance = np.inf
+                    if distance > max_distance:
+                        allowed[code] = False
+            codes = index['venue_codes'][matches]
+            matches = matches[(codes >= 0) & allowed[np.maximum(codes, 0)]]
+        menu_df = self.REPORTS['MENUS']
+        df = menu_df.loc[menu_df.index.intersection(matches)]
+        print(len(df), "menu items found.")
+        if get_stats == True:
+            return VipData.getMenuStats(self, menus=df)
+        return df
+
     def getMenuStats(self, menus=None, confidence=0.98):
         """
         Description
@@ -685,12 +1476,16 @@ class VipData:
         menu_df = self.REPORTS['MENUS']
         if menus is not None:
             menu_df = menus
-        menu_data = menu_df[['venue_name', 'menu_name', 'section_name', \
+        ## venue ids keep same-named venues apart, when the frame has them
+        venue_columns = ['venue_name', 'venue_id'] \
+            if 'venue_id' in menu_df.columns else ['venue_name']
+        menu_data = menu_df[venue_columns + ['menu_name', 'section_name', \
             'item_name', 'item_desc', 'item_price']]
-        menu_data = menu_data.dropna()
-        menu_desc = menu_data.groupby(['menu_name']).describe()
+        menu_data = menu_data.dropna(subset=['item_price'])
+        menu_desc = menu_data.groupby(['menu_name'], observed=True).describe()
         explore_menus = menu_data.groupby(
-            ['venue_name', 'menu_name', 'section_name']).describe()
+            venue_columns + ['menu_name', 'section_name'], 
+            observed=True, dropna=False).describe()
         items = menu_data['item_price']
         bayes_stats = scipy.stats.bayes_mvs(items, alpha=confidence)
         menuStats = {
@@ -701,6 +1496,454 @@ class VipData:
         self.REPORTS['STATS'] = menuStats
         return menuStats
 
+    def setDensityGrid(self, venues=None, menus=None, cell_size=250.0, 
+        bandwidth=None, save_grid=True):
+        """
+        Description
+        -----------
+        Bins venue coordinates into a regular lat/lng grid with per-category
+        venue counts and per-cell average menu prices. Only occupied cells
+        are stored, as 'cell_rows' and 'cell_cols' with one value per cell
+        in 'counts', 'total', 'density' and 'avg_price'.
+
+        Parameters
+        ----------
+        venues: DataFrame, list;  
+        A venue dataframe, or a list of venue dataframes and VipData instances
+        to combine several sites. Defaults to 'REPORTS['VENUES']'.
+
+        menus: DataFrame, list;  
+        A menu dataframe, or a list of them, joined on 'venue_id' for prices.
+        Defaults to the 'MENUS' reports of the given instances.
+
+        cell_size: float;  
+        Grid cell edge length in meters. Default value: 250.
+
+        bandwidth: float;  
+        Gaussian kernel bandwidth in meters for a smoothed density surface.
+        'None' by default.
+
+        save_grid: bool;  
+        Indicates whether to output the grid as an npz file.
+        """
+        if venues is None:
+            venues = [self]
+        elif not isinstance(venues, list):
+            venues = [venues]
+        if menus is None:
+            menus = [site.REPORTS['MENUS'] for site in venues 
+                if isinstance(site, VipData)]
+        elif not isinstance(menus, list):
+            menus = [menus]
+        frames = []
+        for site in venues:
+            if isinstance(site, VipData):
+                if site.REPORTS['VENUES'] is None:
+                    VipData.setVenuesDf(site)
+                site = site.REPORTS['VENUES']
+            site = site[[column for column in ['venue_id', 'category_idn', 
+                'category_ids', 'venue_lat', 'venue_lng'] if column in site.columns]]
+            frames += [site]
+        if len(frames) == 0:
+            print("No venues found! Density grid not created.")
+            return None
+        venue_df = pd.concat(frames, ignore_index=True)
+        ## overlapping sites return the same venues, venues without ids are kept
+        venue_df = venue_df[venue_df['venue_id'].isna() 
+            | ~venue_df.duplicated('venue_id')]
+        lat = pd.to_numeric(venue_df['venue_lat'], errors='coerce').values
+        lng = pd.to_numeric(venue_df['venue_lng'], errors='coerce').values
+        located = ~(np.isnan(lat) | np.isnan(lng))
+        lat, lng = lat[located], lng[located]
+        venue_df = venue_df[located]
+        if len(venue_df) == 0:
+            print("No located venues found! Density grid not created.")
+            return None
+        ## CELL SIZE IN DEGREES FOR A CELL SIZE IN METERS
+        lat_step = cell_size / 111320.0
+        lng_step = cell_size / (111320.0 * np.cos(np.radians(lat.mean())))
+        n_lat = int((lat.max() - lat.min()) // lat_step) + 1
+        n_lng = int((lng.max() - lng.min()) // lng_step) + 1
+        rows = np.minimum(((lat - lat.min()) / lat_step).astype(np.int64), n_lat - 1)
+        cols = np.minimum(((lng - lng.min()) / lng_step).astype(np.int64), n_lng - 1)
+        ## ONLY OCCUPIED CELLS ARE BINNED, SO DISTANT MARKETS COST NOTHING
+        ## FOR THE EMPTY SPACE BETWEEN THEM
+        occupied, cells = np.unique(rows * n_lng + cols, return_inverse=True)
+        cells = cells.reshape(-1)
+        n_cells = len(occupied)
+        cell_rows, cell_cols = occupied // n_lng, occupied % n_lng
+        ## PER-CATEGORY COUNTS IN ONE BINCOUNT OVER (CELL, CATEGORY) PAIRS,
+        ## COUNTING A VENUE UNDER EVERY CATEGORY IT WAS RETURNED UNDER
+        if 'category_ids' in venue_df.columns:
+            memberships = venue_df['category_ids'].astype(object).where(
+                venue_df['category_ids'].notna(), venue_df['category_idn'])
+        else:
+            memberships = venue_df['category_idn'].astype(object)
+        memberships = pd.Series(
+            memberships.astype(str).str.split(",").values, index=np.arange(len(cells))
+            ).explode()
+        codes, categories = pd.factorize(memberships.values)
+        counts = np.bincount(
+            cells[memberships.index.values] * len(categories) + codes, 
+            minlength=n_cells * len(categories)
+            ).reshape(n_cells, len(categories)).astype(np.int32)
+        total = np.bincount(cells, minlength=n_cells).astype(np.int32)
+        ## AVERAGE OF VENUE MEAN MENU PRICES PER CELL
+        menu_frames = [frame[['venue_id', 'item_price']] for frame in menus 
+            if frame is not None]
+        avg_price = np.full(n_cells, np.nan, dtype=np.float32)
+        if len(menu_frames) > 0:
+            venue_prices = pd.concat(menu_frames).dropna().groupby(
+                'venue_id', observed=True)['item_price'].mean()
+            prices = venue_df['venue_id'].map(venue_prices).values.astype(np.float64)
+            priced = ~np.isnan(prices)
+            price_sums = np.bincount(cells[priced], weights=prices[priced], 
+                minlength=n_cells)
+            price_counts = np.bincount(cells[priced], minlength=n_cells)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                avg_price = (price_sums / price_counts).astype(np.float32)
+        density = total.astype(np.float32)
+        if bandwidth is not None:
+            ## GAUSSIAN KERNEL SUMMED FROM OCCUPIED NEIGHBOR CELLS, ONE
+            ## VECTORIZED LOOKUP PER KERNEL OFFSET
+            sigma = bandwidth / cell_size
+            reach = int(np.ceil(3 * sigma))
+            offsets = np.arange(-reach, reach + 1)
+            kernel = np.exp(-(offsets[:, None]**2 + offsets[None, :]**2) / (2 * sigma**2))
+            kernel = kernel / kernel.sum()
+            density = np.zeros(n_cells, dtype=np.float64)
+            for y, dy in enumerate(offsets):
+                for x, dx in enumerate(offsets):
+                    neighbor_rows, neighbor_cols = cell_rows + dy, cell_cols + dx
+                    valid = (neighbor_rows >= 0) & (neighbor_rows < n_lat) \
+                        & (neighbor_cols >= 0) & (neighbor_cols < n_lng)
+                    keys = neighbor_rows * n_lng + neighbor_cols
+                    positions = np.minimum(np.searchsorted(occupied, keys), n_cells - 1)
+                    found = valid & (occupied[positions] == keys)
+                    density[found] += kernel[y, x] * total[positions[found]]
+            density = density.astype(np.float32)
+        grid = {
+            "origin": np.array([lat.min(), lng.min()]),
+            "step": np.array([lat_step, lng_step]),
+            "shape": np.array([n_lat, n_lng]),
+            "cell_rows": cell_rows,
+            "cell_cols": cell_cols,
+            "categories": np.asarray(categories, dtype=str),
+            "counts": counts,
+            "total": total,
+            "density": density,
+            "avg_price": avg_price
+            }
+        self.REPORTS['GRID'] = grid
+        print(("Density grid created: {} venues in {} occupied cells.").format(
+            len(venue_df), n_cells))
+        if save_grid == True:
+            np.savez_compressed(self.OUTPUT_LABELS['gridLabel'], **grid)
+        return grid
+
+    def getDensityGrid(self, file_name=None):
+        """
+        Description
+        -----------
+        A method for reconstituting a density grid saved by 'setDensityGrid()'.
+
+        Parameters
+        ----------
+        file_name: str;  
+        An npz file name for retrieving the grid. Defaults to 'gridLabel'.
+        """
+        if file_name is None:
+            file_name = self.OUTPUT_LABELS['gridLabel']
+        with np.load(file_name) as data:
+            grid = {key: data[key] for key in data.files}
+        print(file_name, "found!")
+        self.REPORTS['GRID'] = grid
+        return grid
+
+    def setDensityMap(self, grid=None, category=None, save_map=True):
+        """
+        Description
+        -----------
+        A method for creating a Folium heatmap layer from a density grid.
+
+        Parameters
+        ----------
+        grid: dict;  
+        A grid from 'setDensityGrid()'. Defaults to 'REPORTS['GRID']'.
+
+        category: str;  
+        A 'category id' to map alone. All categories by default.
+
+        save_map: bool;  
+        Indicates whether to output the heatmap as an html.
+        """
+        if grid is None:
+            grid = self.REPORTS['GRID']
+        if category is None:
+            weights = grid['density']
+        else:
+            position = list(grid['categories']).index(category)
+            weights = grid['counts'][:, position].astype(np.float32)
+        lat_centers = grid['origin'][0] + (grid['cell_rows'] + 0.5) * grid['step'][0]
+        lng_centers = grid['origin'][1] + (grid['cell_cols'] + 0.5) * grid['step'][1]
+        shown = weights > 0
+        points = np.column_stack(
+            (lat_centers[shown], lng_centers[shown], weights[shown])).tolist()
+        m = folium.Map(
+            name="Venue Density", 
+            location=(float(lat_centers.mean()), float(lng_centers.mean())), 
+            zoom_start=11, control_scale=True)
+        folium.plugins.HeatMap(points, name="Venue Density").add_to(m)
+        self.REPORTS['HEATMAP'] = m
+        if save_map == True:
+            m.save(self.OUTPUT_LABELS['heatmapLabel'])
+        return m
+
+    @staticmethod
+    def setAtomicPickle(data, file_name):
+        """
+        Description
+        -----------
+        Pickles an object to a temporary file and then renames it over 
+        'file_name', so an interrupted write never leaves a partial file.
+
+        Parameters
+        ----------
+        data: object;  
+        A picklable object.
+
+        file_name: str;  
+        A file name for storing the pickle.
+        """
+        directory = os.path.dirname(os.path.abspath(file_name))
+        with tempfile.NamedTemporaryFile(
+            "wb", dir=directory, suffix=".tmp", delete=False) as f:
+            try:
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+                f.flush()
+                os.fsync(f.fileno())
+            except:
+                f.close()
+                os.remove(f.name)
+                raise
+        os.replace(f.name, file_name)
+        return file_name
+
+    def setPickle(self, file_name=None):
+        """
+        Description
+        -----------
+        A method for pickling the current instance, excluding folium maps
+        and 'CREDENTIALS'.
+
+        Parameters
+        ----------
+        file_name: str;  
+        A file name for storing the pickle. Defaults to 'pickleLabel'.
+        """
+        if file_name is None:
+            file_name = self.OUTPUT_LABELS['pickleLabel']
+        VipData.setAtomicPickle(self, file_name)
+        print(file_name, "pickle file created!")
+        return file_name
+
+    @staticmethod
+    def getPickle(file_name):
+        """
+        Description
+        -----------
+        A method for reconstituting a previously pickled instance. Set 
+        'CREDENTIALS' on the instance before making further API queries.
+
+        Parameters
+        ----------
+        file_name: str;  
+        A file name for retrieving the pickle.
+        """
+        with open(file_name, "rb") as f:
+            client = pickle.load(f)
+        print(file_name, "found!")
+        return client
+
+    def runPipeline(self, get_menus=False, checkpoint=True, options=None, 
+        callback=None, refresh=False, error_callback=None):
+        """
+        Description
+        -----------
+        Runs the stages in 'PIPELINE_STAGES' in order, saving each stage's
+        state to the 'checkpointLabel' directory. Stages with a checkpoint are
+        restored instead of rerun, so a failed run resumes where it stopped.
+        A stage whose options changed is rerun, and a stage whose inputs were
+        rebuilt by an earlier stage is rerun with it.
+
+        Parameters
+        ----------
+        get_menus: bool;  
+        Set 'True' to include the menu stages. 'False' by default.
+
+        checkpoint: bool;  
+        Reads and writes stage checkpoints. 'True' by default.
+
+        options: dict;  
+        Keyword arguments for stage methods keyed by stage name, 
+        e.g. {"VENUES": {"adaptive": True}}.
+
+        callback: function;  
+        Called with the stage name and instance after each stage.
+
+        refresh: bool;  
+        Reruns every stage, overwriting existing checkpoints. 'False' by default.
+
+        error_callback: function;  
+        Called with the stage name, instance and error message when an 
+        optional stage fails.
+        """
+        if options is None:
+            options = {}
+        checkpoint_dir = Path(self.OUTPUT_LABELS['checkpointLabel'])
+        if checkpoint == True:
+            checkpoint_dir.mkdir(parents=True, exist_ok=True)
+        ## run id of the last stage with state, checkpoints built from
+        ## another run of an earlier stage are stale
+        upstream = None
+        for stage in VipData.PIPELINE_STAGES:
+            if stage['menus'] and not get_menus:
+                continue
+            name = stage['name']
+            file_name = checkpoint_dir / (name + ".pickle")
+            kwargs = dict(options.get(name, {}))
+            if name == "MENUS":
+                kwargs.setdefault('resume', True)
+            signature = json.dumps({"options": kwargs, "upstream": upstream}, 
+                sort_keys=True, default=str)
+            saved = None
+            if checkpoint == True and not refresh and file_name.exists():
+                with open(file_name, "rb") as f:
+                    saved = pickle.load(f)
+                if saved.get('options') != signature:
+                    print("Stage", name, "checkpoint is stale, "
+                        "stage options or an earlier stage changed.")
+                    saved = None
+                else:
+                    VipData.setStageState(self, saved['state'])
+            if saved is not None and saved['complete']:
+                print("Stage", name, "restored from checkpoint.")
+                run = saved['run']
+            else:
+                run = uuid.uuid4().hex
+                try:
+                    getattr(VipData, stage['method'])(self, **kwargs)
+                    complete = True
+                except:
+                    traceback.print_exc()
+                    error = traceback.format_exc().strip().splitlines()[-1]
+                    complete = False
+                if checkpoint == True and (complete or len(stage['state']) > 0):
+                    ## a failed stage keeps its partial state for the next run
+                    VipData.setAtomicPickle({
+                        "complete": complete, 
+                        "options": signature,
+                        "run": run,
+                        "state": VipData.getStageState(self, stage['state'])
+                        }, str(file_name))
+                if not complete:
+                    if stage['required']:
+                        raise RuntimeError(("Stage {} failed! "
+                            "Rerun to resume from checkpoint.").format(name))
+                    print("Stage", name, "failed! Continuing.")
+                    if error_callback is not None:
+                        error_callback(name, self, error)
+                    continue
+                print("Stage", name, "complete.")
+            if len(stage['state']) > 0:
+                upstream = run
+            if callback is not None:
+                callback(name, self)
+        return self
+
+    def getStageState(self, keys):
+        """
+        Description
+        -----------
+        Returns instance values for 'PIPELINE_STAGES' state keys, 
+        e.g. "JSON_DATA.VENUES" or "VENUE_STORE".
+        """
+        state = {}
+        for key in keys:
+            attribute, _, item = key.partition(".")
+            value = getattr(self, attribute)
+            state[key] = value[item] if item else value
+        return state
+
+    def setStageState(self, state):
+        """
+        Description
+        -----------
+        Restores instance values from 'getStageState()' results.
+        """
+        for key, value in state.items():
+            attribute, _, item = key.partition(".")
+            if item:
+                getattr(self, attribute)[item] = value
+            else:
+                setattr(self, attribute, value)
+        return
+
+    def getStageSummary(self, stage):
+        """
+        Description
+        -----------
+        Returns a json-serializable summary of a 'PIPELINE_STAGES' result.
+
+        Parameters
+        ----------
+        stage: str;  
+        A stage name, e.g. "VENUES_DF".
+        """
+        if stage == "LOCATION":
+            ## stored coordinates only, a summary never geocodes
+            location = self.JSON_DATA['LOCATION'] or {}
+            try:
+                coords = location['json']['result']['addressMatches'][0]['coordinates']
+                latlng = ("{},{}").format(coords['y'], coords['x'])
+            except (KeyError, IndexError, TypeError):
+                try:
+                    latlng = ("{},{}").format(location['json']['lat'], location['json']['lon'])
+                except (KeyError, TypeError):
+                    latlng = None
+            return {
+                "latlng": latlng,
+                "tract": {key: value for key, value in self.REPORTS['TRACT'].items()
+                    if isinstance(value, (str, int, float))}
+                }
+        elif stage == "VENUES":
+            return {
+                "venue_count": len(self.VENUE_STORE), 
+                "radius": self.REPORTS['TRACT'].get('RADIUS'),
+                "adaptive_radius": self.REPORTS['TRACT'].get('ADAPTIVE_RADIUS')
+                }
+        elif stage == "VENUES_DF":
+            return json.loads(self.REPORTS['VENUES'].to_json(orient="records"))
+        elif stage == "MAP":
+            return {"file": self.OUTPUT_LABELS['foliumLabel']}
+        elif stage == "MENUS":
+            return {"menu_count": len(self.JSON_DATA['MENUS'] or {})}
+        elif stage == "MENUS_DF":
+            return {"item_count": len(self.REPORTS['MENUS'])}
+        elif stage == "STATS":
+            stats = self.REPORTS['STATS']
+            menu_desc = stats['menu_desc'].copy()
+            menu_desc.columns = ["_".join(column) for column in menu_desc.columns]
+            return {
+                "bayes_mvs": {
+                    name: {"statistic": result.statistic, "minmax": result.minmax}
+                    for name, result in zip(["mean", "var", "std"], stats['bayes_mvs'])
+                    },
+                "menu_desc": json.loads(menu_desc.to_json(orient="index"))
+                }
+        else:
+            return {}
+
     def setJson(self):
         """
         Description
@@ -783,11 +2026,14 @@ class VipData:
         return
 
     @staticmethod
-    def start(address=None, credentials=None, get_menus=False):
+    def start(address=None, credentials=None, get_menus=False, 
+        checkpoint=True, gazetteer=None, options=None, callback=None):
         """
         Description
         -----------
         A method for automatically populating an instance with data.
+        Each stage is checkpointed, so rerunning after a failure resumes
+        from the failed stage without repeating completed API queries.
 
         Parameters
         ----------
@@ -803,37 +2049,311 @@ class VipData:
         get_menus: bool;  
         Set 'True' to include a subsequent menu query procedure. 
         'False' by default.
+
+        checkpoint: bool;  
+        Reads and writes stage checkpoints. 'True' by default.
+
+        gazetteer: str;  
+        An offline gazetteer index directory for geocoding fallback.
+
+        options: dict;  
+        Keyword arguments for stage methods keyed by stage name.
+
+        callback: function;  
+        Called with the stage name and instance after each stage.
         """
         if address is None:
             address = input("Enter address here:") 
         if credentials is None:
             credentials = VipData.getJsonTokens()
         try:
-            ## INITIALIZATION
-            client = VipData(address, credentials)
-            try:
-                ## VENUES
-                client.getVenues()
-                client.setVenuesDf()
-                client.setVenuesMap()
-                if get_menus is True:
-                    try:
-                        ## MENUS
-                        client.getMenus()
-                        client.setMenusDf()
-                        client.getMenuStats()
-                        client.setPickle()
-                        client.setJson()
-                        print("Procedure complete!")
-                        return client.REPORTS['MENUS']
-                    except:
-                        print('Menus failed! Procedure incomplete.')
-                        pass
-                else:
-                    return client.REPORTS['VENUES']
-            except:
-                print('Venues failed!')
-                pass
+            ## INITIALIZATION, GEOCODING RUNS AS THE FIRST STAGE
+            client = VipData(address, credentials, gazetteer=gazetteer, 
+                geocode=False)
         except:
             print('Initialization failed! Procedure aborted.')
-            pass
\ No newline at end of file
+            return
+        try:
+            client.runPipeline(get_menus=get_menus, checkpoint=checkpoint, 
+                options=options, callback=callback)
+        except RuntimeError as error:
+            print(error)
+            print('Procedure incomplete.')
+            return
+        print("Procedure complete!")
+        if get_menus is True:
+            return client.REPORTS['MENUS']
+        else:
+            return client.REPORTS['VENUES']
+
+    @staticmethod
+    def serve(credentials=None, host="127.0.0.1", port=8765, gazetteer=None, 
+        checkpoint=True, output_dir="vip_service", max_jobs=100):
+        """
+        Description
+        -----------
+        Runs a local HTTP service that keeps instances, API clients and 
+        reports in memory between requests. See 'VipDataHandler'.
+
+        Parameters
+        ----------
+        credentials: dict;  
+        Key-value pairs for the credentials used by every job.
+        Defaults to 'getJsonTokens()'.
+
+        host: str;  
+        The interface to listen on. Default value: "127.0.0.1".
+
+        port: int;  
+        The port to listen on. Default value: 8765.
+
+        gazetteer: str;  
+        An offline gazetteer index directory for geocoding fallback.
+
+        checkpoint: bool;  
+        Reads and writes stage checkpoints for each job. 'True' by default.
+
+        output_dir: str;  
+        The directory for every job's output and checkpoint files.
+        Default value: "vip_service".
+
+        max_jobs: int;  
+        The number of completed jobs and addresses kept in memory, least
+        recently used first out. Default value: 100.
+        """
+        if credentials is None:
+            credentials = VipData.getJsonTokens()
+        server = http.server.ThreadingHTTPServer((host, port), VipDataHandler)
+        server.credentials = credentials
+        server.gazetteer = gazetteer
+        server.checkpoint = checkpoint
+        server.output_dir = output_dir
+        ## WARM INSTANCES AND COMPLETED STAGES KEYED BY ADDRESS AND OPTIONS,
+        ## WITH THE LATEST JOB PER ADDRESS FOR '/reports', BOTH LRU ORDERED
+        server.max_jobs = max_jobs
+        server.jobs = collections.OrderedDict()
+        server.clients = collections.OrderedDict()
+        server.stages = {}
+        ## A FIXED SET OF LOCKS SHARED BY ADDRESS HASH
+        server.locks = [threading.Lock() for _ in range(64)]
+        server.lock = threading.Lock()
+        print(("Serving on http://{}:{}").format(host, port))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        server.server_close()
+        print("Service stopped.")
+        return
+
+
+class VipDataHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Description
+    -----------
+    Request handler for 'VipData.serve()'.
+
+    Endpoints
+    ---------
+        POST /jobs          # RUNS A BATCH OF ADDRESSES, e.g.
+                            # {"addresses": [...], "get_menus": true,
+                            #  "options": {"VENUES": {"adaptive": true}},
+                            #  "refresh": false}
+                            # STREAMS ONE JSON LINE PER STAGE AS IT FINISHES
+        GET /reports?address=...  # RETURNS CACHED STAGE SUMMARIES
+        GET /health               # RETURNS WARM ADDRESSES
+    """
+    protocol_version = "HTTP/1.1"
+    ## STAGE OPTIONS A JOB MAY SET, WITH THEIR ACCEPTED TYPES
+    JOB_OPTIONS = {
+        "VENUES": {
+            "adaptive": bool, "target": int, "max_calls": int, 
+            "categories": (str, list), "query": str, "radius": (int, float), 
+            "intent": str, "limit": int
+            },
+        "MENUS_DF": {
+            "drop_na": bool, "compact": bool, "index": bool, 
+            "drop_menus_with": list
+            },
+        "STATS": {"confidence": (int, float)}
+        }
+    ## EXCLUSIVE (LOW, HIGH) BOUNDS FOR NUMERIC OPTIONS, NONE IS UNBOUNDED
+    JOB_BOUNDS = {
+        "target": (0, None), "max_calls": (0, None), "radius": (0, None), 
+        "limit": (0, None), "confidence": (0, 1)
+        }
+
+    def do_GET(self):
+        """Returns cached reports or service health."""
+        path, _, query = self.path.partition("?")
+        params = urllib.parse.parse_qs(query)
+        if path == "/health":
+            with self.server.lock:
+                addresses = list(self.server.clients)
+            self.setJsonResponse(200, {"addresses": addresses})
+        elif path == "/reports":
+            address = params.get("address", [""])[0]
+            with self.server.lock:
+                client = self.server.clients.get(address)
+                stages = self.server.stages.get(address, [])
+            if client is None:
+                self.setJsonResponse(404, {"error": "Address not analyzed: " + address})
+                return
+            self.setJsonResponse(200, {
+                stage: VipData.getStageSummary(client, stage) for stage in stages
+                })
+        else:
+            self.setJsonResponse(404, {"error": "Unknown path: " + path})
+
+    def do_POST(self):
+        """Runs a batch of address jobs, streaming each stage result."""
+        if self.path != "/jobs":
+            self.setJsonResponse(404, {"error": "Unknown path: " + self.path})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            job = json.loads(self.rfile.read(length) or b"{}")
+            addresses = job['addresses']
+            if not isinstance(addresses, list) or len(addresses) == 0 \
+                or not all(isinstance(address, str) and address.strip() 
+                    for address in addresses):
+                raise TypeError("'addresses' must be a list of non-empty strings.")
+            options = VipDataHandler.getJobOptions(job.get('options'))
+        except (ValueError, KeyError, TypeError, AttributeError) as error:
+            self.setJsonResponse(400, {
+                "error": "Invalid job.", "detail": str(error)
+                })
+            return
+        get_menus = bool(job.get('get_menus', False))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for address in addresses:
+            VipDataHandler.setJob(self, address.strip(), get_menus, 
+                options, bool(job.get('refresh', False)))
+        self.wfile.write(b"0\r\n\r\n")
+
+    @staticmethod
+    def getJobOptions(options):
+        """
+        Description
+        -----------
+        Returns job stage options checked against 'JOB_OPTIONS' and 
+        'JOB_BOUNDS', raising ValueError or TypeError for any other stage, 
+        option, type or value.
+        """
+        if options is None:
+            return {}
+        if not isinstance(options, dict):
+            raise TypeError("'options' must be an object keyed by stage name.")
+        for stage, kwargs in options.items():
+            if stage not in VipDataHandler.JOB_OPTIONS:
+                raise ValueError("Options are not accepted for stage: " + str(stage))
+            if not isinstance(kwargs, dict):
+                raise TypeError("Options for stage {} must be an object.".format(stage))
+            for key, value in kwargs.items():
+                accepted = VipDataHandler.JOB_OPTIONS[stage].get(key)
+                if accepted is None:
+                    raise ValueError(("Option '{}' is not accepted for stage {}.").format(
+                        key, stage))
+                ## json booleans are ints to python, so only bool options take them
+                if not isinstance(value, accepted) or (
+                    isinstance(value, bool) and accepted is not bool) or (
+                    isinstance(value, list) and not all(isinstance(item, str) for item in value)):
+                    raise TypeError(("Option '{}' for stage {} has an invalid type.").format(
+                        key, stage))
+                low, high = VipDataHandler.JOB_BOUNDS.get(key, (None, None))
+                if (low is not None and not value > low) or (
+                    high is not None and not value < high):
+                    raise ValueError(("Option '{}' for stage {} is out of range.").format(
+                        key, stage))
+        return options
+
+    def setJob(self, address, get_menus, options=None, refresh=False):
+        """
+        Description
+        -----------
+        Runs one address through 'runPipeline()', reusing a warm instance 
+        when its stages are already complete.
+        """
+        server = self.server
+        lock = server.locks[hash(address) % len(server.locks)]
+        ## one job per address at a time, so a repeated address waits for
+        ## the first job and is then served from memory
+        ## results made with other options are never reused
+        key = (address, json.dumps(options or {}, sort_keys=True))
+        with lock:
+            wanted = [stage for stage in VipData.PIPELINE_STAGES 
+                if get_menus or not stage['menus']]
+            with server.lock:
+                client, done = server.jobs.get(key, (None, []))
+                if client is not None:
+                    server.jobs.move_to_end(key)
+            if not refresh and client is not None and all(stage['name'] in done 
+                for stage in wanted if stage['required']):
+                for stage in wanted:
+                    if stage['name'] in done:
+                        VipDataHandler.setStreamLine(self, address, stage['name'], 
+                            client, cached=True)
+                VipDataHandler.setStreamLine(self, address, "DONE")
+                return
+            client = VipData(address, server.credentials, 
+                gazetteer=server.gazetteer, geocode=False)
+            ## output and checkpoint files stay inside the service directory
+            client.setOutputLabels(server.output_dir)
+            stages = []
+            def callback(name, client):
+                stages.append(name)
+                VipDataHandler.setStreamLine(self, address, name, client)
+            def error_callback(name, client, error):
+                VipDataHandler.setStreamLine(self, address, name, error=error, 
+                    failed=True)
+            try:
+                client.runPipeline(get_menus=get_menus, 
+                    checkpoint=server.checkpoint, options=options, 
+                    callback=callback, refresh=refresh, 
+                    error_callback=error_callback)
+            except Exception as error:
+                VipDataHandler.setStreamLine(self, address, "ERROR", error=str(error))
+                return
+            with server.lock:
+                server.jobs[key] = (client, stages)
+                server.jobs.move_to_end(key)
+                server.clients[address] = client
+                server.clients.move_to_end(address)
+                server.stages[address] = stages
+                while len(server.jobs) > server.max_jobs:
+                    server.jobs.popitem(last=False)
+                while len(server.clients) > server.max_jobs:
+                    server.stages.pop(server.clients.popitem(last=False)[0], None)
+            VipDataHandler.setStreamLine(self, address, "DONE")
+
+    def setStreamLine(self, address, stage, client=None, cached=False, error=None, 
+        failed=False):
+        """Writes one json line as an HTTP chunk and flushes it."""
+        line = {"address": address, "stage": stage}
+        if failed == True:
+            line["failed"] = True
+        if client is not None:
+            line["cached"] = cached
+            try:
+                line["result"] = VipData.getStageSummary(client, stage)
+            except Exception as summary_error:
+                line["result"] = None
+                line["error"] = str(summary_error)
+        if error is not None:
+            line["error"] = error
+        data = (json.dumps(line, default=str) + "\n").encode("utf-8")
+        self.wfile.write(("{:X}\r\n").format(len(data)).encode("ascii") 
+            + data + b"\r\n")
+        self.wfile.flush()
+
+    def setJsonResponse(self, status, payload):
+        """Writes a complete json response."""
+        data = json.dumps(payload, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)